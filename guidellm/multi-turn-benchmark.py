@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""Multi-turn conversation benchmark for OpenAI-compatible LLM endpoints.
+
+Drives N concurrent multi-turn conversations against /v1/chat/completions,
+seeding each conversation with a large document so that every turn after the
+first shares a long common prefix with the previous request. Per-turn TTFT is
+reported, so the effect of prefix caching (vLLM, llm-d) shows up directly as
+the gap between first-turn and later-turn latency.
+
+Usage:
+    python multi-turn-benchmark.py http://host:8000/v1 -d seed-documents \
+        --conversations 20 --turns 10 --max-tokens 150 --verbose
+
+Dependencies: httpx with HTTP/2 support, orjson, numpy; uvloop is used when
+installed (pip install "httpx[http2]" orjson numpy uvloop)
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+import orjson
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - optional speedup
+    uvloop = None
+
+CODE_EXTENSIONS = {".c", ".cpp", ".go", ".java", ".js", ".py", ".rs", ".ts"}
+TEXT_EXTENSIONS = {".md", ".rst", ".txt"}
+ALLOWED_EXTS = CODE_EXTENSIONS | TEXT_EXTENSIONS
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+async def iter_sse_data(response: httpx.Response):
+    """Yield the payload of each SSE ``data:`` frame as bytes.
+
+    Works on the raw byte stream so no per-frame UTF-8 decode or str slicing
+    happens per token; the payloads feed straight into orjson.loads.
+    """
+    buf = bytearray()
+    async for chunk in response.aiter_bytes():
+        buf.extend(chunk)
+        while True:
+            newline = buf.find(b"\n")
+            if newline < 0:
+                break
+            frame = bytes(buf[:newline])
+            del buf[: newline + 1]
+            if frame.endswith(b"\r"):
+                frame = frame[:-1]
+            if frame.startswith(b"data: "):
+                yield frame[6:]
+
+
+CODE_STARTERS = (
+    "Review the following code and explain what it does:",
+    "Analyze this code and describe its structure:",
+    "Read this code and summarize its main components:",
+)
+TEXT_STARTERS = (
+    "Read the following document and summarize it:",
+    "Review this document and describe its main points:",
+    "Analyze the following text and explain its key ideas:",
+)
+CONTINUATIONS = (
+    "Can you go into more detail on that?",
+    "What are the main weaknesses you see?",
+    "How could this be improved?",
+    "Summarize your previous answer in two sentences.",
+    "What questions would you ask the author?",
+    "Are there any edge cases worth considering?",
+    "Explain the most important part again, more simply.",
+    "What would you change first, and why?",
+)
+
+
+@dataclass(slots=True)
+class SeedDocument:
+    """A document used to seed the first turn of a conversation."""
+
+    name: str
+    doc_type: str  # "code" or "text"
+    content: str
+
+    @classmethod
+    def load(cls, path: Path) -> "SeedDocument":
+        doc_type = "code" if path.suffix.lower() in CODE_EXTENSIONS else "text"
+        content = path.read_text(encoding="utf-8", errors="replace")
+        return cls(name=path.name, doc_type=doc_type, content=content)
+
+
+@dataclass(slots=True)
+class ConversationStats:
+    """Timing for a single conversation turn."""
+
+    conversation_id: int
+    turn: int
+    doc_type: str
+    ttft_ms: Optional[float]
+    total_ms: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    error: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Conversation:
+    """One multi-turn conversation seeded with a document."""
+
+    id: int
+    document: SeedDocument
+    messages: List[Dict] = field(default_factory=list)
+    turns_completed: int = 0
+    completed: bool = False
+    _rng: random.Random = field(init=False, repr=False)
+    _starter: str = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        # Seed from the conversation id so prompt selection is reproducible
+        # across runs and free of global-RNG contention between workers.
+        self._rng = random.Random(self.id)
+        self._starter = self._build_starter()
+
+    def _build_starter(self) -> str:
+        starters = CODE_STARTERS if self.document.doc_type == "code" else TEXT_STARTERS
+        instruction = self._rng.choice(starters)
+        return f"{instruction}\n\n```\n{self.document.content}\n```"
+
+    def get_starter_prompt(self) -> str:
+        return self._starter
+
+    def get_continuation_prompt(self) -> str:
+        return self._rng.choice(CONTINUATIONS)
+
+
+class MultiturnBenchmark:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.base_url = args.url.rstrip("/")
+        self.seed_documents_dir: Path = args.seed_documents_dir
+        self.num_conversations = args.conversations
+        self.turns_per_conversation = args.turns
+        self.max_tokens = args.max_tokens
+        self.parallel = args.parallel
+        self.timeout = args.timeout
+        self.min_delay = args.min_delay
+        self.max_delay = args.max_delay
+        self.no_keepalive = args.no_keepalive
+        self.session_mode = args.session_mode
+        self.verbose = args.verbose
+        self.documents: List[SeedDocument] = []
+        self.conversations: List[Conversation] = []
+        self.all_stats: List[ConversationStats] = []
+        self.client: Optional[httpx.AsyncClient] = None
+        self.model_name: Optional[str] = None
+        # Buffered writer for per-turn logging; flushed every few turns rather
+        # than per print call, which matters when stdout is a pipe.
+        self._out = sys.stdout.write
+        self._log_count = 0
+
+    async def load_seed_documents(self) -> None:
+        if not self.seed_documents_dir.is_dir():
+            raise SystemExit(f"Seed document directory not found: {self.seed_documents_dir}")
+        with os.scandir(self.seed_documents_dir) as it:
+            entries = sorted(
+                (e for e in it if e.is_file() and Path(e.name).suffix.lower() in ALLOWED_EXTS),
+                key=lambda e: e.name,
+            )
+        if not entries:
+            raise SystemExit(f"No usable seed documents in {self.seed_documents_dir}")
+        # Read the files off the event loop so multi-MB documents load in parallel.
+        self.documents = list(
+            await asyncio.gather(
+                *(asyncio.to_thread(SeedDocument.load, Path(e.path)) for e in entries)
+            )
+        )
+
+    async def get_model_name(self) -> str:
+        response = await self.client.get(f"{self.base_url}/models")
+        response.raise_for_status()
+        return response.json()["data"][0]["id"]
+
+    async def _stream_completion(
+        self, payload: Dict
+    ) -> Tuple[str, Optional[float], float, Dict]:
+        """POST a streaming chat completion and consume its SSE stream.
+
+        Returns (text, ttft_ms, total_ms, usage). Transport errors propagate
+        to the caller.
+        """
+        parts: List[str] = []
+        ttft_ms: Optional[float] = None
+        usage: Dict = {}
+        body = orjson.dumps(payload)
+        # Bound locals for the per-token loop; global/attribute lookups per
+        # delta add up over ~max_tokens events per request.
+        _get = dict.get
+        _append = parts.append
+        _clock = time.perf_counter
+        start = _clock()
+        async with self.client.stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            content=body,
+            headers=JSON_HEADERS,
+            timeout=self.timeout,
+        ) as response:
+            if response.status_code >= 400:
+                response.raise_for_status()
+            async for data_bytes in iter_sse_data(response):
+                if data_bytes == b"[DONE]":
+                    break
+                try:
+                    data = orjson.loads(data_bytes)
+                except orjson.JSONDecodeError:
+                    continue
+                if ttft_ms is None:
+                    ttft_ms = (_clock() - start) * 1000
+                choices = _get(data, "choices")
+                if choices:
+                    delta = _get(choices[0], "delta")
+                    content = _get(delta, "content") if delta else None
+                    if content:
+                        _append(content)
+                new_usage = _get(data, "usage")
+                if new_usage:
+                    usage = new_usage
+        total_ms = (time.perf_counter() - start) * 1000
+        return "".join(parts), ttft_ms, total_ms, usage
+
+    async def send_chat_request(
+        self, conversation: Conversation, turn: int
+    ) -> Tuple[Optional[str], ConversationStats]:
+        if self.session_mode == "delta" and turn > 1:
+            # Only the latest exchange; the server reconstructs the prefix
+            # from its KV cache, keyed by the per-conversation salt below.
+            messages = conversation.messages[-2:]
+        else:
+            messages = conversation.messages
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "max_tokens": self.max_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        if self.session_mode == "delta":
+            payload["cache_salt"] = f"mt-conv-{conversation.id}"
+        start = time.perf_counter()
+        try:
+            text, ttft_ms, total_ms, usage = await self._stream_completion(payload)
+        except (httpx.HTTPError, asyncio.TimeoutError) as exc:
+            total_ms = (time.perf_counter() - start) * 1000
+            return None, ConversationStats(
+                conversation_id=conversation.id,
+                turn=turn,
+                doc_type=conversation.document.doc_type,
+                ttft_ms=None,
+                total_ms=total_ms,
+                error=str(exc),
+            )
+        return text, ConversationStats(
+            conversation_id=conversation.id,
+            turn=turn,
+            doc_type=conversation.document.doc_type,
+            ttft_ms=ttft_ms,
+            total_ms=total_ms,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+        )
+
+    async def run_warmup(self) -> None:
+        """Send a few short requests so model load and connection setup are not measured."""
+        print(f"Warming up with {self.parallel} requests...")
+
+        async def warm(i: int) -> None:
+            payload = {
+                "model": self.model_name,
+                "messages": [{"role": "user", "content": f"Warmup request {i}: reply with OK."}],
+                "max_tokens": 5,
+                "stream": True,
+            }
+            try:
+                await self._stream_completion(payload)
+            except (httpx.HTTPError, asyncio.TimeoutError) as exc:
+                print(f"  warmup request {i} failed: {exc}")
+
+        await asyncio.gather(*(warm(i) for i in range(self.parallel)))
+
+    async def run_conversation_turn(self, conversation: Conversation) -> None:
+        turn = conversation.turns_completed + 1
+        if turn == 1:
+            prompt = conversation.get_starter_prompt()
+        else:
+            prompt = conversation.get_continuation_prompt()
+        conversation.messages.append({"role": "user", "content": prompt})
+        response_text, stats = await self.send_chat_request(conversation, turn)
+        if response_text is not None:
+            conversation.messages.append({"role": "assistant", "content": response_text})
+        conversation.turns_completed = turn
+        if turn >= self.turns_per_conversation:
+            conversation.completed = True
+        self.all_stats.append(stats)
+        if self.verbose:
+            if stats.ttft_ms is not None:
+                ttft_str = f"{stats.ttft_ms:8.2f}"
+            else:
+                ttft_str = "     n/a"
+            line = (
+                f"[conv {conversation.id:3d} turn {turn:2d}/{self.turns_per_conversation}] "
+                f"ttft={ttft_str} ms total={stats.total_ms:8.2f} ms"
+            )
+            if stats.error:
+                line += f" error={stats.error}"
+            self._out(line + "\n")
+            self._log_count += 1
+            if self._log_count % 10 == 0:
+                sys.stdout.flush()
+
+    async def run_parallel_conversations(self) -> None:
+        """Run all conversations with at most `parallel` requests in flight.
+
+        One coroutine per conversation keeps its turns strictly sequential;
+        a shared semaphore caps how many turns are in flight at once.
+        """
+        semaphore = asyncio.Semaphore(self.parallel)
+
+        async def run_conversation(conversation: Conversation) -> None:
+            for _ in range(self.turns_per_conversation):
+                await asyncio.sleep(
+                    conversation._rng.uniform(self.min_delay, self.max_delay)
+                )
+                async with semaphore:
+                    await self.run_conversation_turn(conversation)
+
+        await asyncio.gather(*(run_conversation(c) for c in self.conversations))
+
+    def _print_summary(self, total_time: float) -> None:
+        print("\n" + "=" * 80)
+        print("BENCHMARK SUMMARY")
+        print("=" * 80 + "\n")
+        ok = [s for s in self.all_stats if s.error is None]
+        completed = sum(1 for c in self.conversations if c.completed)
+        print(f"Total time: {total_time:.2f}s")
+        print(f"Total requests: {len(self.all_stats)}")
+        print(f"Completed conversations: {completed}/{len(self.conversations)}")
+        print(f"Requests per second: {len(self.all_stats) / total_time:.2f}")
+
+        timed = [s for s in ok if s.ttft_ms is not None]
+        ttft = np.fromiter((s.ttft_ms for s in timed), dtype=np.float64)
+        if ttft.size:
+            p50, p95, p99 = np.percentile(ttft, [50, 95, 99])
+            print("\nTime to First Token (TTFT):")
+            print(f"  Min:    {ttft.min():10.2f} ms")
+            print(f"  Max:    {ttft.max():10.2f} ms")
+            print(f"  Mean:   {ttft.mean():10.2f} ms")
+            print(f"  P50:    {p50:10.2f} ms")
+            print(f"  P95:    {p95:10.2f} ms")
+            print(f"  P99:    {p99:10.2f} ms")
+
+        total_values = np.fromiter((s.total_ms for s in ok), dtype=np.float64)
+        if total_values.size:
+            p50, p95 = np.percentile(total_values, [50, 95])
+            print("\nTotal Request Time:")
+            print(f"  Min:    {total_values.min():10.2f} ms")
+            print(f"  Max:    {total_values.max():10.2f} ms")
+            print(f"  Mean:   {total_values.mean():10.2f} ms")
+            print(f"  P50:    {p50:10.2f} ms")
+            print(f"  P95:    {p95:10.2f} ms")
+
+        if ttft.size:
+            turns = np.fromiter((s.turn for s in timed), dtype=np.int32)
+            counts = np.bincount(turns, minlength=self.turns_per_conversation + 1)
+            sums = np.bincount(turns, weights=ttft, minlength=self.turns_per_conversation + 1)
+            means = sums / np.maximum(counts, 1)
+            print("\nTTFT by Turn Number:")
+            for turn in range(1, min(self.turns_per_conversation, counts.size - 1) + 1):
+                if counts[turn]:
+                    print(
+                        f"  Turn {turn:2d}: {means[turn]:10.2f} ms avg "
+                        f"({counts[turn]} requests)"
+                    )
+
+            is_code = np.fromiter((s.doc_type == "code" for s in timed), dtype=bool)
+            print("\nTTFT by Document Type:")
+            for doc_type, mask in (("code", is_code), ("text", ~is_code)):
+                if mask.any():
+                    print(
+                        f"  {doc_type.upper()}: {ttft[mask].mean():10.2f} ms avg "
+                        f"({int(mask.sum())} requests)"
+                    )
+
+            first_mask = turns == 1
+            if first_mask.any() and not first_mask.all():
+                first_avg = ttft[first_mask].mean()
+                later_avg = ttft[~first_mask].mean()
+                print("\nFirst Turn vs Subsequent Turns (Prefix Caching Indicator):")
+                print(f"  First turn avg: {first_avg:10.2f} ms")
+                print(f"  Later turns avg: {later_avg:10.2f} ms")
+                if later_avg > 0:
+                    print(f"  Speedup ratio: {first_avg / later_avg:10.2f}x")
+
+    async def run(self) -> None:
+        await self.load_seed_documents()
+        print(f"Loaded {len(self.documents)} seed documents from {self.seed_documents_dir}")
+
+        if self.no_keepalive:
+            # One fresh connection per request; useful to spread load across
+            # replicas when there is no load balancer doing round-robin.
+            limits = httpx.Limits(max_keepalive_connections=0, max_connections=100)
+        else:
+            limits = httpx.Limits(
+                max_keepalive_connections=self.parallel * 2,
+                max_connections=100,
+                keepalive_expiry=60.0,
+            )
+        self.client = httpx.AsyncClient(
+            verify=False, http2=True, timeout=self.timeout, limits=limits
+        )
+        try:
+            self.model_name = await self.get_model_name()
+            print(f"Benchmarking model: {self.model_name}")
+            num = min(self.num_conversations, len(self.documents))
+            if num < self.num_conversations:
+                print(f"Only {len(self.documents)} seed documents available; running {num} conversations")
+            self.conversations = [
+                Conversation(id=i, document=self.documents[i]) for i in range(num)
+            ]
+            await self.run_warmup()
+            print(
+                f"\nRunning {num} conversations x {self.turns_per_conversation} turns "
+                f"(parallel={self.parallel})..."
+            )
+            start = time.perf_counter()
+            await self.run_parallel_conversations()
+            total_time = time.perf_counter() - start
+            sys.stdout.flush()
+            self._print_summary(total_time)
+        finally:
+            await self.client.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Multi-turn conversation benchmark for OpenAI-compatible endpoints"
+    )
+    parser.add_argument("url", help="Base URL of the endpoint, e.g. http://host:8000/v1")
+    parser.add_argument(
+        "-d",
+        "--seed-documents-dir",
+        type=Path,
+        default=Path("seed-documents"),
+        help="Directory of seed documents (one conversation per document)",
+    )
+    parser.add_argument("--conversations", type=int, default=20, help="Number of conversations")
+    parser.add_argument("--turns", type=int, default=10, help="Turns per conversation")
+    parser.add_argument("--max-tokens", type=int, default=500, help="Max tokens per response")
+    parser.add_argument("--parallel", type=int, default=4, help="Concurrent requests")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Request timeout in seconds")
+    parser.add_argument("--min-delay", type=float, default=0.5, help="Min delay between turns (s)")
+    parser.add_argument("--max-delay", type=float, default=2.0, help="Max delay between turns (s)")
+    parser.add_argument(
+        "--session-mode",
+        choices=("full-history", "delta"),
+        default="full-history",
+        help="full-history resends the whole conversation each turn; delta sends "
+        "only the latest exchange plus a per-conversation cache salt (vLLM)",
+    )
+    parser.add_argument(
+        "--no-keepalive",
+        action="store_true",
+        help="Open a new connection per request instead of reusing pooled connections",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Log each turn as it completes")
+    args = parser.parse_args()
+
+    if uvloop is not None:
+        uvloop.install()
+    benchmark = MultiturnBenchmark(args)
+    asyncio.run(benchmark.run())
+
+
+if __name__ == "__main__":
+    main()